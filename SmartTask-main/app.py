@@ -1,10 +1,14 @@
 import os
+import json
 import logging
 from datetime import timedelta
 
+import click
 from flask import Flask
+from flask_caching import Cache
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import NullPool
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
@@ -26,21 +30,54 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for
 
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+if os.environ.get("DB_POOLER") == "pgbouncer":
+    # PgBouncer in transaction mode (pool_mode = transaction) already shares a
+    # few server connections between all workers, so don't keep a second pool
+    # per worker. psycopg2 doesn't use server-side prepared statements, so
+    # nothing else needs to change for transaction pooling.
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "poolclass": NullPool,
+    }
+else:
+    # Every worker process has its own pool, so split a total connection budget
+    # between the gunicorn workers (gunicorn.conf.py exports GUNICORN_WORKERS).
+    # The default of 80 stays under Postgres' default max_connections of 100,
+    # leaving room for init-db, psql and other clients.
+    db_connections_per_worker = max(
+        int(os.environ.get("DB_MAX_CONNECTIONS", 80)) // int(os.environ.get("GUNICORN_WORKERS", 1)), 2
+    )
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+        # Size the pool explicitly so concurrent requests don't queue for a connection
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", db_connections_per_worker // 2)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", db_connections_per_worker - db_connections_per_worker // 2)),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        "pool_use_lifo": True,  # keep a small set of hot connections in use
+    }
+
+# Keep compiled SQL for every hot query shape instead of re-compiling on eviction
+app.config["SQLALCHEMY_ENGINE_OPTIONS"]["query_cache_size"] = int(os.environ.get("DB_QUERY_CACHE_SIZE", 1200))
 
 # JWT configuration
 app.config["JWT_SECRET_KEY"] = os.environ.get("SESSION_SECRET", "jwt-secret-key")
+app.config["JWT_ALGORITHM"] = "HS256"
+app.config["JWT_DECODE_ALGORITHMS"] = ["HS256"]  # only accept the algorithm we sign with
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
 app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=30)
 
 # File upload configuration
-UPLOAD_FOLDER = 'static/uploads'
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'static/uploads')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
 
+# When set, authorized downloads are handed to nginx with X-Accel-Redirect
+# instead of being streamed by the worker, e.g. with
+#   location /internal/uploads/ { internal; alias /app/static/uploads/; sendfile on; tcp_nopush on; }
+app.config['UPLOADS_ACCEL_PREFIX'] = os.environ.get('UPLOADS_ACCEL_PREFIX')  # e.g. '/internal/uploads'
+# Behind Apache with mod_xsendfile, send_file() can hand off with X-Sendfile instead
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+
 # Email configuration
 app.config['MAIL_SERVER'] = 'smtp.gmail.com'
 app.config['MAIL_PORT'] = 465
@@ -49,7 +86,16 @@ app.config['MAIL_USERNAME'] = os.environ.get("MAIL_USERNAME")
 app.config['MAIL_PASSWORD'] = os.environ.get("MAIL_PASSWORD")
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get("MAIL_DEFAULT_SENDER", "noreply@smarttask.com")
 
+# Cache configuration; shared Redis cache when REDIS_URL is set, per-process otherwise
+app.config['CACHE_TYPE'] = 'RedisCache' if os.environ.get("REDIS_URL") else 'SimpleCache'
+app.config['CACHE_REDIS_URL'] = os.environ.get("REDIS_URL")
+app.config['CACHE_DEFAULT_TIMEOUT'] = 300
+# Background voice jobs are polled through the cache, so any worker must be able to
+# see them; with the per-process cache voice commands are processed in the request
+app.config['VOICE_JOBS_ASYNC'] = app.config['CACHE_TYPE'] == 'RedisCache'
+
 # Initialize extensions
+cache = Cache(app)
 jwt = JWTManager(app)
 mail = Mail(app)
 login_manager = LoginManager(app)
@@ -69,4 +115,40 @@ with app.app_context():
     import models  # noqa: F401
     from routes import *  # noqa: F401, F403
 
+    # create_all() introspects the schema on every worker boot, so only run it
+    # automatically in development; deployments run `flask --app main init-db`
+    if os.environ.get("FLASK_ENV") == "development":
+        db.create_all()
+        models.upgrade_timestamp_columns()
+        models.upgrade_indexes()
+
+
+@app.cli.command("init-db")
+def init_db_command():
+    """Create any missing database tables and indexes and upgrade older timestamp columns"""
     db.create_all()
+    models.upgrade_timestamp_columns()
+    models.upgrade_indexes()
+    print("Database tables created")
+
+
+@app.cli.command("ai-batch-submit")
+@click.argument("records", type=click.File())
+def ai_batch_submit_command(records):
+    """Queue task descriptions for a JSON lines file of records with the OpenAI Batch API"""
+    from utils import submit_task_description_batch
+    batch_id = submit_task_description_batch([json.loads(line) for line in records if line.strip()])
+    print(batch_id)
+
+
+@app.cli.command("ai-batch-ingest")
+@click.argument("batch_id")
+def ai_batch_ingest_command(batch_id):
+    """Print the results of a finished task description batch as JSON lines"""
+    from utils import fetch_task_description_batch
+    status, results = fetch_task_description_batch(batch_id)
+    if results is None:
+        print(f"Batch {batch_id} is still {status}")
+        return
+    for record_id, result in results.items():
+        print(json.dumps({'id': record_id, **result}))
@@ -0,0 +1,24 @@
+import multiprocessing
+import os
+
+# Requests spend most of their time waiting on the database, SMTP and OpenAI,
+# so each worker serves many requests concurrently on gevent greenlets instead
+# of blocking a whole process per request. Run with the wsgi:app entry point,
+# which monkey patches the standard library and psycopg2 before the app loads.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gevent")
+workers = int(os.environ.get("GUNICORN_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 4)))
+
+# Workers inherit this, and app.py divides DB_MAX_CONNECTIONS between them so the
+# per-worker pools together stay within the database's connection limit
+os.environ["GUNICORN_WORKERS"] = str(workers)
+
+# Greenlets beyond the worker's share of DB_MAX_CONNECTIONS wait up to
+# DB_POOL_TIMEOUT for a connection, so requests that never touch the database
+# (or only briefly) are what make a high connection count pay off.
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 500))
+
+# Only used with GUNICORN_WORKER_CLASS=gthread; keep at or below the worker's pool size
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+# AI generation and voice transcription can take well over the 30s default
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
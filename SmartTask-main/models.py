@@ -1,31 +1,106 @@
-from datetime import datetime
-from app import db, login_manager
+import os
+from app import db, login_manager, cache
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerifyMismatchError
+from flask import current_app
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import make_transient_to_detached
+from werkzeug.security import check_password_hash
+
+
+# Argon2id hasher; tune the cost parameters to the deployment hardware
+password_hasher = PasswordHasher(
+    time_cost=int(os.environ.get("ARGON2_TIME_COST", 2)),
+    memory_cost=int(os.environ.get("ARGON2_MEMORY_COST", 65536)),
+    parallelism=int(os.environ.get("ARGON2_PARALLELISM", 1)),
+)
+
+# Verified when no account matches a login, so failed logins take the same
+# time whether or not the email is registered
+_DUMMY_HASH = password_hasher.hash(os.urandom(16).hex())
+
+
+def verify_dummy_password(password):
+    try:
+        password_hasher.verify(_DUMMY_HASH, password or '')
+    except VerifyMismatchError:
+        pass
+    return False
+
+
+# How long a loaded user stays in the shared cache, in seconds
+USER_CACHE_TIMEOUT = 60
+
+
+def _user_cache_key(user_id):
+    return f'user:{user_id}'
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    uid = int(user_id)
+    
+    # Rebuild the user from the shared cache without querying; password_hash is
+    # never cached and loads on first access. If the cache is unreachable, fall
+    # back to the database rather than failing every request.
+    try:
+        data = cache.get(_user_cache_key(uid))
+    except Exception as e:
+        current_app.logger.warning(f"User cache unavailable: {str(e)}")
+        return db.session.get(User, uid)
+    if data is not None:
+        user = User(**data)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    
+    # Checks the session's identity map first, so later lookups in the request are free
+    user = db.session.get(User, uid)
+    if user is not None:
+        try:
+            cache.set(_user_cache_key(uid), {
+                'id': user.id,
+                'username': user.username,
+                'email': user.email,
+                'role': user.role,
+                'created_at': user.created_at,
+            }, timeout=USER_CACHE_TIMEOUT)
+        except Exception as e:
+            current_app.logger.warning(f"User cache unavailable: {str(e)}")
+    return user
 
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(256), nullable=False)
+    password_hash = db.deferred(db.Column(db.String(256), nullable=False))  # only loaded when checking passwords
     role = db.Column(db.String(20), nullable=False)  # 'admin' or 'client'
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.now(), server_default=db.func.now())
     
     # Relationships
     tasks_assigned = db.relationship('Task', backref='client', lazy=True, foreign_keys='Task.client_id')
     tasks_created = db.relationship('Task', backref='creator', lazy=True, foreign_keys='Task.creator_id')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        if not self.password_hash.startswith('$argon2'):
+            # Werkzeug hash from before the Argon2 migration; upgrade it on success
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        
+        try:
+            password_hasher.verify(self.password_hash, password)
+        except (VerifyMismatchError, InvalidHashError):
+            return False
+        
+        # Rehash if the cost parameters have been changed since this hash was made
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def is_admin(self):
         return self.role == 'admin'
@@ -37,16 +112,27 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    # Drop the cached copy whenever the password, role or profile changes; runs
+    # inside the flush, so a cache outage must not abort the write
+    try:
+        cache.delete(_user_cache_key(target.id))
+    except Exception as e:
+        current_app.logger.warning(f"User cache unavailable: {str(e)}")
+
+
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(128), nullable=False)
-    description = db.Column(db.Text, nullable=True)
+    description = db.deferred(db.Column(db.Text, nullable=True), group='body')  # loaded on access or via undefer_group('body')
     service_type = db.Column(db.String(64), nullable=True)
     priority = db.Column(db.String(20), nullable=False, default='medium')  # low, medium, high
     status = db.Column(db.String(20), nullable=False, default='pending')  # pending, in-progress, completed
     deadline = db.Column(db.DateTime, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.now(), server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, nullable=False, default=db.func.now(), server_default=db.func.now(), onupdate=db.func.now())
     
     # Foreign keys
     client_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -56,21 +142,50 @@ class Task(db.Model):
     comments = db.relationship('Comment', backref='task', lazy=True, cascade="all, delete-orphan")
     attachments = db.relationship('Attachment', backref='task', lazy=True, cascade="all, delete-orphan")
     
+    # Indexes matching the dashboard and task list filters
+    __table_args__ = (
+        db.Index('ix_task_client_status_deadline', 'client_id', 'status', 'deadline'),
+        db.Index('ix_task_creator_status', 'creator_id', 'status'),
+        # Newest-first listings per admin and per client
+        db.Index('ix_task_creator_created', creator_id, created_at.desc()),
+        db.Index('ix_task_client_created', client_id, created_at.desc()),
+        # Partial indexes over open tasks only, for the "due soon" lists
+        db.Index('ix_task_open', 'client_id', 'deadline',
+                 postgresql_where=db.text("status <> 'completed'"),
+                 sqlite_where=db.text("status <> 'completed'")),
+        db.Index('ix_task_creator_open', 'creator_id', 'deadline',
+                 postgresql_where=db.text("status <> 'completed'"),
+                 sqlite_where=db.text("status <> 'completed'")),
+        # Trigram indexes so the title/description ILIKE '%term%' search can use
+        # an index scan on Postgres
+        db.Index('ix_task_title_trgm', 'title', postgresql_using='gin',
+                 postgresql_ops={'title': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        db.Index('ix_task_description_trgm', 'description', postgresql_using='gin',
+                 postgresql_ops={'description': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+    
     def __repr__(self):
         return f'<Task {self.title}>'
 
 
+# The trigram indexes above need pg_trgm, so enable it before the task table is created
+db.event.listen(
+    Task.__table__, 'before_create',
+    db.DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'),
+)
+
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.now(), server_default=db.func.now())
     
     # Foreign keys
     task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
     # Relationships
-    user = db.relationship('User', backref='comments')
+    user = db.relationship('User', backref='comments', lazy='selectin')
     
     def __repr__(self):
         return f'<Comment {self.id}>'
@@ -78,17 +193,17 @@ class Comment(db.Model):
 
 class Attachment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    filename = db.Column(db.String(256), nullable=False)
+    filename = db.Column(db.String(256), nullable=False, index=True)  # "<sha256[:2]>/<sha256>" under UPLOAD_FOLDER
     original_filename = db.Column(db.String(256), nullable=False)
     file_type = db.Column(db.String(64), nullable=False)
-    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    uploaded_at = db.Column(db.DateTime, nullable=False, default=db.func.now(), server_default=db.func.now())
     
     # Foreign keys
     task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
     # Relationships
-    user = db.relationship('User', backref='attachments')
+    user = db.relationship('User', backref='attachments', lazy='selectin')
     
     def __repr__(self):
         return f'<Attachment {self.filename}>'
@@ -99,14 +214,65 @@ class Notification(db.Model):
     title = db.Column(db.String(128), nullable=False)
     message = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=db.func.now(), server_default=db.func.now())
     
     # Foreign keys
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     task_id = db.Column(db.Integer, db.ForeignKey('task.id'), nullable=True)
     
     # Relationships
-    user = db.relationship('User', backref='notifications')
+    user = db.relationship('User', backref='notifications', lazy='selectin')
+    
+    # Index for the unread notification count and listing
+    __table_args__ = (
+        db.Index('ix_notif_user_unread', 'user_id', 'is_read', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<Notification {self.id}>'
+
+
+# Timestamp columns filled in by the database. Tables created before they had a
+# server default and NOT NULL aren't changed by create_all(), so init-db brings
+# them in line with upgrade_timestamp_columns().
+TIMESTAMP_COLUMNS = (
+    (User.__table__, 'created_at'),
+    (Task.__table__, 'created_at'),
+    (Task.__table__, 'updated_at'),
+    (Comment.__table__, 'created_at'),
+    (Attachment.__table__, 'uploaded_at'),
+    (Notification.__table__, 'created_at'),
+)
+
+
+def upgrade_timestamp_columns():
+    """Backfill missing timestamps, then add the server default and NOT NULL (Postgres only)"""
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as conn:
+        for table, column in TIMESTAMP_COLUMNS:
+            # updated_at is listed after created_at, so it can fall back to the creation time
+            value = db.func.coalesce(table.c.created_at, db.func.now()) if column == 'updated_at' else db.func.now()
+            conn.execute(db.update(table).where(table.c[column].is_(None)).values({column: value}))
+            
+            if conn.dialect.name == 'postgresql':
+                name = f'{preparer.format_table(table)} ALTER COLUMN {preparer.quote(column)}'
+                conn.execute(db.text(f'ALTER TABLE {name} SET DEFAULT now()'))
+                conn.execute(db.text(f'ALTER TABLE {name} SET NOT NULL'))
+
+
+# Indexes earlier versions created that the composite indexes above make redundant
+OBSOLETE_INDEXES = ('ix_task_status', 'ix_task_priority', 'ix_notif_unread')
+
+
+def upgrade_indexes():
+    """Drop obsolete indexes, then create the pg_trgm extension (Postgres only) and any missing indexes"""
+    with db.engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.execute(db.text(f'DROP INDEX IF EXISTS {conn.dialect.identifier_preparer.quote(name)}'))
+        if conn.dialect.name == 'postgresql':
+            conn.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        # create_all() only adds indexes along with a new table; ddl_if still
+        # skips the trigram indexes on other databases
+        for table in (Task.__table__, Notification.__table__, Attachment.__table__):
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
@@ -0,0 +1,58 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token buckets for requests per minute and tokens per minute
+    
+    Shared by every thread (or greenlet) in the process; acquire() blocks until
+    a request fits within both limits. A limit of None is not enforced.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = requests_per_minute or 0
+        self._tokens = tokens_per_minute or 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute,
+                                 self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute,
+                               self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens=0):
+        """
+        Wait until one more request using the given number of tokens is allowed
+        
+        Args:
+            tokens (int): Estimated prompt plus completion tokens for the request
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                
+                wait = 0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = (1 - self._requests) * 60 / self.requests_per_minute
+                if self.tokens_per_minute:
+                    # A single request larger than the whole budget only waits for a full bucket
+                    tokens = min(tokens, self.tokens_per_minute)
+                    if self._tokens < tokens:
+                        wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                
+                if not wait:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
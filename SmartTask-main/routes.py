@@ -1,16 +1,174 @@
-import os
-import uuid
+import hashlib
 from datetime import datetime
 from functools import wraps
 
-from flask import render_template, redirect, url_for, flash, request, jsonify, send_from_directory, abort, make_response
+from flask import render_template, redirect, url_for, flash, request, jsonify, send_from_directory, abort, make_response, session, g
 from flask_login import login_user, logout_user, current_user, login_required
+from sqlalchemy import and_, case, func
+from sqlalchemy.orm import joinedload, raiseload, selectinload, undefer, undefer_group
 from werkzeug.utils import secure_filename
 
 from app import app, db
-from models import User, Task, Comment, Attachment, Notification
+from models import User, Task, Comment, Attachment, Notification, verify_dummy_password
 from auth import admin_required, client_required
-from utils import send_task_notification_email, get_status_badge_class, generate_ai_task_description, analyze_task_priority
+from utils import (send_task_notification_email, get_status_badge_class, generate_ai_task_description, analyze_task_priority, create_notifications,
+                   get_unread_notification_count, invalidate_unread_count, submit_voice_command, get_voice_job, process_voice_command, save_upload)
+
+
+def get_task_status_counts(*criteria):
+    """
+    Count tasks per status in a single aggregate query
+    
+    Args:
+        *criteria: Filter expressions selecting the tasks to count
+        
+    Returns:
+        tuple: (total, pending, in_progress, completed)
+    """
+    counts = db.session.query(
+        func.count(Task.id).label('total'),
+        func.sum(case((Task.status == 'pending', 1), else_=0)).label('pending'),
+        func.sum(case((Task.status == 'in-progress', 1), else_=0)).label('in_progress'),
+        func.sum(case((Task.status == 'completed', 1), else_=0)).label('completed')
+    ).filter(*criteria).one()
+    
+    # SUM() is NULL when no rows match
+    return counts.total, counts.pending or 0, counts.in_progress or 0, counts.completed or 0
+
+
+def get_recent_and_due_soon_tasks(owner_column, related, limit=5):
+    """
+    Load a user's newest tasks and open tasks due next in a single query
+    
+    Each list is picked by its own ORDER BY ... LIMIT subquery; the two id
+    lists are combined with UNION ALL and the tasks fetched in one round trip.
+    
+    Args:
+        owner_column: Task column holding the current user's id (creator_id or client_id)
+        related: Relationship to join in for display (Task.client or Task.creator)
+        limit (int): Number of tasks in each list
+        
+    Returns:
+        tuple: (recent_tasks, due_soon)
+    """
+    recent = db.select(Task.id).where(
+        owner_column == current_user.id
+    ).order_by(Task.created_at.desc(), Task.id.desc()).limit(limit).subquery()
+    
+    due = db.select(Task.id).where(
+        owner_column == current_user.id,
+        Task.status != 'completed',
+        Task.deadline > datetime.utcnow()
+    ).order_by(Task.deadline, Task.id).limit(limit).subquery()
+    
+    buckets = db.union_all(
+        db.select(recent.c.id, db.literal('recent').label('bucket')),
+        db.select(due.c.id, db.literal('due').label('bucket'))
+    ).subquery()
+    
+    rows = db.session.execute(
+        db.select(Task, buckets.c.bucket)
+        .join(buckets, Task.id == buckets.c.id)
+        .options(joinedload(related), raiseload('*'))
+    ).all()
+    
+    # A task can be in both lists; the identity map hands back the same object
+    recent_tasks = sorted((task for task, bucket in rows if bucket == 'recent'),
+                          key=lambda task: (task.created_at, task.id), reverse=True)
+    due_soon = sorted((task for task, bucket in rows if bucket == 'due'),
+                      key=lambda task: (task.deadline, task.id))
+    return recent_tasks, due_soon
+
+
+def get_theme():
+    """
+    Get the theme chosen with the theme cookie, read once per request
+    
+    Returns:
+        str: Theme name
+    """
+    if 'theme' not in g:
+        g.theme = request.cookies.get('theme', 'light')
+    return g.theme
+
+
+def get_page_etag(*criteria, include_clients=False):
+    """
+    Build a weak ETag for a page rendered from the current user's tasks
+    
+    Args:
+        *criteria: Filter expressions selecting the tasks the page is built from
+        include_clients (bool): Whether the page also lists the clients
+        
+    Returns:
+        str: ETag value that changes whenever the rendered page could
+    """
+    columns = [func.max(Task.updated_at), func.count(Task.id)]
+    if include_clients:
+        columns.append(db.select(func.max(User.id)).where(User.role == 'client').scalar_subquery())
+    state = db.session.query(*columns).filter(*criteria).one()
+    
+    parts = (
+        current_user.id,
+        get_theme(),
+        # The navbar lists recent notifications; the count is cached and dropped on every change
+        get_unread_notification_count(current_user.id),
+        # Due-soon lists and overdue badges depend on the time
+        datetime.utcnow().strftime('%Y%m%d%H%M'),
+        *state
+    )
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def conditional_page(owner_column, include_clients=False):
+    """
+    Answer repeat GETs for an unchanged task page with 304 Not Modified
+    
+    Args:
+        owner_column: Task column holding the current user's id (creator_id or client_id)
+        include_clients (bool): Whether the page also lists the clients
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Pending flash messages are part of the page, so render it normally
+            if session.get('_flashes'):
+                return f(*args, **kwargs)
+            
+            etag = get_page_etag(owner_column == current_user.id, include_clients=include_clients)
+            if request.if_none_match.contains_weak(etag):
+                resp = make_response('', 304)
+            else:
+                resp = make_response(f(*args, **kwargs))
+            resp.set_etag(etag, weak=True)
+            resp.headers['Cache-Control'] = 'private, no-cache'
+            return resp
+        return decorated_function
+    return decorator
+
+
+def get_owned_task(task_id, role=None, *options):
+    """
+    Load a task and check that the current user takes part in it
+    
+    Args:
+        task_id (int): Id of the task
+        role (str, optional): 'admin' to require the creator, 'client' to require
+            the assigned client, or None to accept either
+        *options: Extra loader options for the task query
+        
+    Returns:
+        Task: The task, or None if the current user may not access it
+    """
+    task = Task.query.options(*options).get_or_404(task_id)
+    
+    if role == 'admin':
+        allowed = task.creator_id == current_user.id
+    elif role == 'client':
+        allowed = task.client_id == current_user.id
+    else:
+        allowed = current_user.id in (task.creator_id, task.client_id)
+    return task if allowed else None
 
 
 @app.route('/')
@@ -32,9 +190,15 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
         
-        user = User.query.filter_by(email=email).first()
+        user = User.query.options(undefer(User.password_hash)).filter_by(email=email).first()
+        if user is None:
+            # Spend the same hashing time as a real check to avoid user enumeration
+            verify_dummy_password(password)
         
         if user and user.check_password(password):
+            # Persist the password hash if check_password upgraded it
+            if db.session.is_modified(user):
+                db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
             flash('Login successful!', 'success')
@@ -105,26 +269,18 @@ def logout():
 @app.route('/admin/dashboard')
 @login_required
 @admin_required
+@conditional_page(Task.creator_id, include_clients=True)
 def admin_dashboard():
     # Get counts for dashboard
-    total_tasks = Task.query.filter_by(creator_id=current_user.id).count()
-    pending_tasks = Task.query.filter_by(creator_id=current_user.id, status='pending').count()
-    in_progress_tasks = Task.query.filter_by(creator_id=current_user.id, status='in-progress').count()
-    completed_tasks = Task.query.filter_by(creator_id=current_user.id, status='completed').count()
+    total_tasks, pending_tasks, in_progress_tasks, completed_tasks = get_task_status_counts(
+        Task.creator_id == current_user.id
+    )
     
     # Get clients for this admin
     clients = User.query.filter_by(role='client').all()
     
-    # Get recent tasks
-    recent_tasks = Task.query.filter_by(creator_id=current_user.id).order_by(Task.created_at.desc()).limit(5).all()
-    
-    # Get tasks due soon (in the next 7 days)
-    today = datetime.utcnow()
-    due_soon = Task.query.filter(
-        Task.creator_id == current_user.id,
-        Task.status != 'completed',
-        Task.deadline > today
-    ).order_by(Task.deadline).limit(5).all()
+    # Get recent tasks and the open tasks due next
+    recent_tasks, due_soon = get_recent_and_due_soon_tasks(Task.creator_id, Task.client)
     
     return render_template(
         'admin/dashboard.html',
@@ -141,27 +297,31 @@ def admin_dashboard():
 @app.route('/admin/tasks')
 @login_required
 @admin_required
+@conditional_page(Task.creator_id, include_clients=True)
 def admin_tasks():
     # Get filter parameters
     status = request.args.get('status', '')
     priority = request.args.get('priority', '')
-    client_id = request.args.get('client_id', '')
+    client_id = request.args.get('client_id', type=int)  # None when missing or not a number
     search = request.args.get('search', '')
     
-    # Build the query
-    query = Task.query.filter_by(creator_id=current_user.id)
+    # Build the statement; the list renders each task's client, so load them in the same
+    # query and fail loudly on any other lazy load
+    stmt = db.select(Task).options(
+        joinedload(Task.client), raiseload('*'), undefer_group('body')
+    ).where(Task.creator_id == current_user.id)
     
     if status:
-        query = query.filter_by(status=status)
+        stmt = stmt.where(Task.status == status)
     if priority:
-        query = query.filter_by(priority=priority)
-    if client_id and client_id.isdigit():
-        query = query.filter_by(client_id=int(client_id))
+        stmt = stmt.where(Task.priority == priority)
+    if client_id is not None:
+        stmt = stmt.where(Task.client_id == client_id)
     if search:
-        query = query.filter(Task.title.contains(search) | Task.description.contains(search))
+        stmt = stmt.where(Task.title.icontains(search, autoescape=True) | Task.description.icontains(search, autoescape=True))
     
     # Sort by creation date (newest first)
-    tasks = query.order_by(Task.created_at.desc()).all()
+    tasks = db.session.execute(stmt.order_by(Task.created_at.desc())).scalars().all()
     
     # Get all clients for the filter dropdown
     clients = User.query.filter_by(role='client').all()
@@ -173,13 +333,18 @@ def admin_tasks():
 @login_required
 @admin_required
 def admin_clients():
-    clients = User.query.filter_by(role='client').all()
+    # Get every client with their task counts for this admin in one grouped query
+    rows = db.session.query(
+        User,
+        func.count(Task.id),
+        func.sum(case((Task.status == 'completed', 1), else_=0))
+    ).outerjoin(
+        Task, and_(Task.client_id == User.id, Task.creator_id == current_user.id)
+    ).filter(User.role == 'client').group_by(User.id).all()
     
-    # Get task counts for each client
     client_data = []
-    for client in clients:
-        total_tasks = Task.query.filter_by(client_id=client.id, creator_id=current_user.id).count()
-        completed_tasks = Task.query.filter_by(client_id=client.id, creator_id=current_user.id, status='completed').count()
+    for client, total_tasks, completed_tasks in rows:
+        completed_tasks = completed_tasks or 0
         
         # Calculate completion rate
         completion_rate = 0
@@ -236,20 +401,20 @@ def new_task():
         )
         
         db.session.add(new_task)
-        db.session.commit()
+        db.session.flush()  # assigns new_task.id for the notification
         
         # Create notification for the client
-        notification = Notification(
-            title="New Task Assigned",
-            message=f"You have been assigned a new task: {title}",
-            user_id=client_id,
+        create_notifications(
+            [client_id],
+            "New Task Assigned",
+            f"You have been assigned a new task: {title}",
             task_id=new_task.id
         )
-        db.session.add(notification)
         db.session.commit()
+        invalidate_unread_count(int(client_id))
         
         # Send email notification
-        client = User.query.get(client_id)
+        client = db.session.get(User, int(client_id))
         if client:
             send_task_notification_email(client.email, "New Task Assigned", 
                                         f"You have been assigned a new task: {title}")
@@ -266,10 +431,14 @@ def new_task():
 @login_required
 @admin_required
 def edit_task(task_id):
-    task = Task.query.get_or_404(task_id)
-    
-    # Make sure the admin is the creator of this task
-    if task.creator_id != current_user.id:
+    task = get_owned_task(
+        task_id, 'admin',
+        undefer_group('body'),
+        joinedload(Task.client),
+        selectinload(Task.comments).selectinload(Comment.user),
+        selectinload(Task.attachments).selectinload(Attachment.user)
+    )
+    if task is None:
         flash('You are not authorized to edit this task', 'danger')
         return redirect(url_for('admin_tasks'))
     
@@ -290,23 +459,20 @@ def edit_task(task_id):
                 clients = User.query.filter_by(role='client').all()
                 return render_template('admin/task_form.html', task=task, clients=clients)
         
-        db.session.commit()
-        
         # Create notification for the client
-        notification = Notification(
-            title="Task Updated",
-            message=f"A task assigned to you has been updated: {task.title}",
-            user_id=task.client_id,
-            task_id=task.id
-        )
-        db.session.add(notification)
+        message = f"A task assigned to you has been updated: {task.title}"
+        create_notifications([task.client_id], "Task Updated", message, task_id=task.id)
+        
+        # Read the email before commit expires the task; the identity map already
+        # holds the client unless it was just reassigned
+        client_id = int(task.client_id)
+        client = db.session.get(User, client_id)
         db.session.commit()
+        invalidate_unread_count(client_id)
         
         # Send email notification
-        client = User.query.get(task.client_id)
         if client:
-            send_task_notification_email(client.email, "Task Updated", 
-                                        f"A task assigned to you has been updated: {task.title}")
+            send_task_notification_email(client.email, "Task Updated", message)
         
         flash('Task updated successfully!', 'success')
         return redirect(url_for('admin_tasks'))
@@ -320,10 +486,8 @@ def edit_task(task_id):
 @login_required
 @admin_required
 def delete_task(task_id):
-    task = Task.query.get_or_404(task_id)
-    
-    # Make sure the admin is the creator of this task
-    if task.creator_id != current_user.id:
+    task = get_owned_task(task_id, 'admin')
+    if task is None:
         flash('You are not authorized to delete this task', 'danger')
         return redirect(url_for('admin_tasks'))
     
@@ -337,23 +501,15 @@ def delete_task(task_id):
 @app.route('/client/dashboard')
 @login_required
 @client_required
+@conditional_page(Task.client_id)
 def client_dashboard():
     # Get counts for dashboard
-    total_tasks = Task.query.filter_by(client_id=current_user.id).count()
-    pending_tasks = Task.query.filter_by(client_id=current_user.id, status='pending').count()
-    in_progress_tasks = Task.query.filter_by(client_id=current_user.id, status='in-progress').count()
-    completed_tasks = Task.query.filter_by(client_id=current_user.id, status='completed').count()
-    
-    # Get recent tasks
-    recent_tasks = Task.query.filter_by(client_id=current_user.id).order_by(Task.created_at.desc()).limit(5).all()
-    
-    # Get tasks due soon (in the next 7 days)
-    today = datetime.utcnow()
-    due_soon = Task.query.filter(
-        Task.client_id == current_user.id,
-        Task.status != 'completed',
-        Task.deadline > today
-    ).order_by(Task.deadline).limit(5).all()
+    total_tasks, pending_tasks, in_progress_tasks, completed_tasks = get_task_status_counts(
+        Task.client_id == current_user.id
+    )
+    
+    # Get recent tasks and the open tasks due next
+    recent_tasks, due_soon = get_recent_and_due_soon_tasks(Task.client_id, Task.creator)
     
     # Get unread notifications
     notifications = Notification.query.filter_by(
@@ -376,24 +532,28 @@ def client_dashboard():
 @app.route('/client/tasks')
 @login_required
 @client_required
+@conditional_page(Task.client_id)
 def client_tasks():
     # Get filter parameters
     status = request.args.get('status', '')
     priority = request.args.get('priority', '')
     search = request.args.get('search', '')
     
-    # Build the query
-    query = Task.query.filter_by(client_id=current_user.id)
+    # Build the statement; the list renders each task's creator, so load them in the same
+    # query and fail loudly on any other lazy load
+    stmt = db.select(Task).options(
+        joinedload(Task.creator), raiseload('*'), undefer_group('body')
+    ).where(Task.client_id == current_user.id)
     
     if status:
-        query = query.filter_by(status=status)
+        stmt = stmt.where(Task.status == status)
     if priority:
-        query = query.filter_by(priority=priority)
+        stmt = stmt.where(Task.priority == priority)
     if search:
-        query = query.filter(Task.title.contains(search) | Task.description.contains(search))
+        stmt = stmt.where(Task.title.icontains(search, autoescape=True) | Task.description.icontains(search, autoescape=True))
     
     # Sort by creation date (newest first)
-    tasks = query.order_by(Task.created_at.desc()).all()
+    tasks = db.session.execute(stmt.order_by(Task.created_at.desc())).scalars().all()
     
     return render_template('client/tasks.html', tasks=tasks)
 
@@ -402,18 +562,28 @@ def client_tasks():
 @login_required
 @client_required
 def client_task_detail(task_id):
-    task = Task.query.get_or_404(task_id)
-    
-    # Make sure the client is assigned to this task
-    if task.client_id != current_user.id:
+    # Load the creator with the task and every attachment and its uploader in one
+    # more batch, instead of lazy loading them while the page renders
+    task = get_owned_task(
+        task_id, 'client',
+        undefer_group('body'),
+        joinedload(Task.creator),
+        selectinload(Task.attachments).joinedload(Attachment.user)
+    )
+    if task is None:
         flash('You are not authorized to view this task', 'danger')
         return redirect(url_for('client_tasks'))
     
-    # Get comments for this task
-    comments = Comment.query.filter_by(task_id=task_id).order_by(Comment.created_at).all()
+    # Get comments for this task, selecting only the author columns the page shows
+    comments = db.session.execute(
+        db.select(Comment.id, Comment.content, Comment.created_at, User.username, User.role)
+        .join(User, Comment.user_id == User.id)
+        .where(Comment.task_id == task_id)
+        .order_by(Comment.created_at)
+    ).all()
     
-    # Get attachments for this task
-    attachments = Attachment.query.filter_by(task_id=task_id).order_by(Attachment.uploaded_at.desc()).all()
+    # Newest attachments first
+    attachments = sorted(task.attachments, key=lambda attachment: (attachment.uploaded_at, attachment.id), reverse=True)
     
     return render_template('client/task_detail.html', task=task, comments=comments, attachments=attachments, datetime=datetime)
 
@@ -422,10 +592,8 @@ def client_task_detail(task_id):
 @login_required
 @client_required
 def update_task_status(task_id):
-    task = Task.query.get_or_404(task_id)
-    
-    # Make sure the client is assigned to this task
-    if task.client_id != current_user.id:
+    task = get_owned_task(task_id, 'client', joinedload(Task.creator))
+    if task is None:
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return jsonify({'success': False, 'message': 'You are not authorized to update this task'})
         flash('You are not authorized to update this task', 'danger')
@@ -437,24 +605,19 @@ def update_task_status(task_id):
         if task.status != new_status:
             old_status = task.status
             task.status = new_status
-            task.updated_at = datetime.utcnow()
-            db.session.commit()
             
             # Create notification for the admin
-            notification = Notification(
-                title="Task Status Updated",
-                message=f"Task '{task.title}' status updated from {old_status} to {new_status}",
-                user_id=task.creator_id,
-                task_id=task.id
-            )
-            db.session.add(notification)
+            message = f"Task '{task.title}' status updated from {old_status} to {new_status}"
+            create_notifications([task.creator_id], "Task Status Updated", message, task_id=task.id)
+            
+            # The creator was joined in with the task; read it before commit expires it
+            admin_email = task.creator.email
+            creator_id = task.creator_id
             db.session.commit()
+            invalidate_unread_count(creator_id)
             
             # Send email notification
-            admin = User.query.get(task.creator_id)
-            if admin:
-                send_task_notification_email(admin.email, "Task Status Updated", 
-                                            f"Task '{task.title}' status updated from {old_status} to {new_status}")
+            send_task_notification_email(admin_email, "Task Status Updated", message)
         
         # Check if this is an AJAX request or a regular form submission
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -478,10 +641,9 @@ def update_task_status(task_id):
 @app.route('/tasks/<int:task_id>/comments', methods=['POST'])
 @login_required
 def add_comment(task_id):
-    task = Task.query.get_or_404(task_id)
-    
-    # Check authorization (both client assigned to task and admin creator can comment)
-    if current_user.id != task.client_id and current_user.id != task.creator_id:
+    # Both the client assigned to the task and the admin creator can comment
+    task = get_owned_task(task_id)
+    if task is None:
         flash('You are not authorized to comment on this task', 'danger')
         if current_user.role == 'admin':
             return redirect(url_for('admin_tasks'))
@@ -498,18 +660,17 @@ def add_comment(task_id):
             user_id=current_user.id
         )
         db.session.add(comment)
-        db.session.commit()
         
         # Notify the other party
         recipient_id = task.client_id if current_user.id == task.creator_id else task.creator_id
-        notification = Notification(
-            title="New Comment",
-            message=f"New comment on task '{task.title}'",
-            user_id=recipient_id,
+        create_notifications(
+            [recipient_id],
+            "New Comment",
+            f"New comment on task '{task.title}'",
             task_id=task.id
         )
-        db.session.add(notification)
         db.session.commit()
+        invalidate_unread_count(recipient_id)
         
         flash('Comment added successfully', 'success')
     
@@ -523,10 +684,9 @@ def add_comment(task_id):
 @app.route('/tasks/<int:task_id>/attachments', methods=['POST'])
 @login_required
 def upload_attachment(task_id):
-    task = Task.query.get_or_404(task_id)
-    
-    # Check authorization (both client assigned to task and admin creator can upload)
-    if current_user.id != task.client_id and current_user.id != task.creator_id:
+    # Both the client assigned to the task and the admin creator can upload
+    task = get_owned_task(task_id)
+    if task is None:
         flash('You are not authorized to upload attachments to this task', 'danger')
         if current_user.role == 'admin':
             return redirect(url_for('admin_tasks'))
@@ -552,36 +712,32 @@ def upload_attachment(task_id):
             return redirect(url_for('client_task_detail', task_id=task_id))
     
     if file:
-        # Create a unique filename to prevent conflicts
         original_filename = secure_filename(file.filename)
-        file_ext = os.path.splitext(original_filename)[1]
-        unique_filename = f"{uuid.uuid4().hex}{file_ext}"
         
-        # Save the file
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(file_path)
+        # Stored under the hash of its contents, so re-uploading the same file
+        # reuses the copy already on disk
+        stored_filename = save_upload(file.stream)
         
         # Create DB record
         attachment = Attachment(
-            filename=unique_filename,
+            filename=stored_filename,
             original_filename=original_filename,
             file_type=file.content_type,
             task_id=task_id,
             user_id=current_user.id
         )
         db.session.add(attachment)
-        db.session.commit()
         
         # Notify the other party
         recipient_id = task.client_id if current_user.id == task.creator_id else task.creator_id
-        notification = Notification(
-            title="New Attachment",
-            message=f"New file attached to task '{task.title}'",
-            user_id=recipient_id,
+        create_notifications(
+            [recipient_id],
+            "New Attachment",
+            f"New file attached to task '{task.title}'",
             task_id=task.id
         )
-        db.session.add(notification)
         db.session.commit()
+        invalidate_unread_count(recipient_id)
         
         flash('File uploaded successfully', 'success')
     
@@ -592,35 +748,63 @@ def upload_attachment(task_id):
         return redirect(url_for('client_task_detail', task_id=task_id))
 
 
-@app.route('/download/<filename>')
+@app.route('/download/<int:attachment_id>')
 @login_required
-def download_file(filename):
-    attachment = Attachment.query.filter_by(filename=filename).first_or_404()
-    task = Task.query.get_or_404(attachment.task_id)
-    
-    # Check authorization (both client assigned to task and admin creator can download)
-    if current_user.id != task.client_id and current_user.id != task.creator_id:
-        abort(403)
+def download_file(attachment_id):
+    # Look up this task's attachment rather than the stored file, which several
+    # tasks can share, so the download gets the name it was uploaded under here
+    attachment = Attachment.query.join(Task).filter(
+        Attachment.id == attachment_id,
+        (Task.client_id == current_user.id) | (Task.creator_id == current_user.id)
+    ).first()
+    if attachment is None:
+        abort(404)
+    filename = attachment.filename
+    
+    accel_prefix = app.config.get('UPLOADS_ACCEL_PREFIX')
+    if accel_prefix:
+        # Let nginx stream the file from its internal location
+        resp = make_response('')
+        resp.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{filename}"
+        resp.headers['Content-Type'] = attachment.file_type
+        resp.headers['Content-Disposition'] = f'attachment; filename="{attachment.original_filename}"'
+    else:
+        # With USE_X_SENDFILE this also returns straight away and Apache sends the file
+        resp = send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True, 
+                                   download_name=attachment.original_filename)
     
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True, 
-                               download_name=attachment.original_filename)
+    # Stored files are never rewritten, so the browser can keep its copy; private
+    # because shared caches must not serve it without the check above
+    resp.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return resp
 
 
 @app.route('/mark-notification-read/<int:notification_id>', methods=['POST'])
 @login_required
 def mark_notification_read(notification_id):
-    notification = Notification.query.get_or_404(notification_id)
-    
-    # Make sure the notification belongs to the current user
-    if notification.user_id != current_user.id:
-        abort(403)
-    
-    notification.is_read = True
+    # Filtering on the owner makes the ownership check part of the UPDATE itself;
+    # someone else's notification looks the same as a missing one
+    result = db.session.execute(
+        db.update(Notification)
+        .where(Notification.id == notification_id, Notification.user_id == current_user.id)
+        .values(is_read=True)
+        .execution_options(synchronize_session=False)
+    )
     db.session.commit()
+    if not result.rowcount:
+        abort(404)
+    invalidate_unread_count(current_user.id)
     
     return jsonify({'success': True})
 
 
+@app.route('/api/notifications/unread-count')
+@login_required
+def unread_notification_count_api():
+    # Fetched by the navbar after the page loads so full-page renders skip the count query
+    return jsonify({'count': get_unread_notification_count(current_user.id)})
+
+
 @app.route('/toggle-theme', methods=['POST'])
 def toggle_theme():
     theme = request.form.get('theme', 'light')
@@ -687,45 +871,81 @@ def analyze_task_priority_api():
     })
 
 
-@app.route('/api/voice-task', methods=['POST'])
-@login_required
-@admin_required
-def voice_task_api():
-    """API endpoint to process voice commands and create tasks"""
-    # Get audio data from request
-    if not request.is_json or 'audio' not in request.json:
-        return jsonify({'error': 'No audio data provided'}), 400
-    
-    audio_data = request.json.get('audio')
-    
-    # Process voice command
-    from utils import process_voice_command
-    result = process_voice_command(audio_data)
+def voice_result_response(result):
+    """
+    Build the JSON response for a processed voice command
     
+    Args:
+        result (dict): process_voice_command() result
+        
+    Returns:
+        tuple: JSON response and status code
+    """
     if not result['success']:
         return jsonify({
             'success': False,
+            'status': 'done',
             'error': result.get('error', 'Failed to process voice command')
         }), 500
     
     return jsonify({
         'success': True,
+        'status': 'done',
         'transcript': result['transcript'],
         'task_info': result['task_info']
-    })
+    }), 200
 
 
-@app.context_processor
-def utility_processor():
-    def get_unread_notification_count():
-        if current_user.is_authenticated:
-            return Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-        return 0
+@app.route('/api/voice-task', methods=['POST'])
+@login_required
+@admin_required
+def voice_task_api():
+    """API endpoint to process a voice command, or queue it when results can be polled from any worker"""
+    if request.mimetype == 'multipart/form-data':
+        # Raw recording uploaded as a file, without the base64 overhead
+        audio_file = request.files.get('audio')
+        if not audio_file:
+            return jsonify({'error': 'No audio data provided'}), 400
+        audio, mime_type = audio_file.read(), audio_file.mimetype
+    else:
+        # Don't keep a second copy of the (large) parsed body around on the request
+        data = request.get_json(silent=True, cache=False)
+        if not data or 'audio' not in data:
+            return jsonify({'error': 'No audio data provided'}), 400
+        audio, mime_type = data['audio'], None
+    
+    # Without a shared cache the status poll could reach a worker that never saw the
+    # job, so answer in this request instead; under gevent the OpenAI calls still yield
+    if not app.config['VOICE_JOBS_ASYNC']:
+        return voice_result_response(process_voice_command(audio, mime_type))
+    
+    # Decoding and the Whisper/chat calls run in the background; the browser polls for the result
+    job_id = submit_voice_command(audio, current_user.id, mime_type)
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('voice_task_status_api', job_id=job_id)
+    }), 202
+
+
+@app.route('/api/voice-task/<job_id>', methods=['GET'])
+@login_required
+@admin_required
+def voice_task_status_api(job_id):
+    """API endpoint to poll the result of a queued voice command"""
+    job = get_voice_job(job_id)
+    if job is None or job['user_id'] != current_user.id:
+        return jsonify({'success': False, 'error': 'Unknown voice task'}), 404
     
-    def get_theme():
-        return request.cookies.get('theme', 'light')
+    if job['status'] == 'pending':
+        return jsonify({'success': True, 'status': 'pending'})
     
+    return voice_result_response(job)
+
+
+@app.context_processor
+def utility_processor():
     return {
-        'get_unread_notification_count': get_unread_notification_count,
         'get_theme': get_theme
     }
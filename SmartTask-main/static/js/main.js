@@ -11,6 +11,9 @@ document.addEventListener('DOMContentLoaded', function() {
         return new bootstrap.Popover(popoverTriggerEl)
     });
 
+    // Fetch the unread notification count for the navbar badge
+    loadNotificationCounter();
+
     // Handle notification read status
     setupNotificationHandlers();
 
@@ -57,6 +60,28 @@ function setupNotificationHandlers() {
     });
 }
 
+/**
+ * Load the unread notification count into the navbar badge
+ */
+function loadNotificationCounter() {
+    const counter = document.getElementById('notification-counter');
+    if (!counter || !counter.dataset.url) {
+        return;
+    }
+
+    fetch(counter.dataset.url, {
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest'
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        counter.textContent = data.count;
+        counter.style.display = data.count > 0 ? '' : 'none';
+    })
+    .catch(error => console.error('Error loading notification count:', error));
+}
+
 /**
  * Update the notification counter in the navbar
  */
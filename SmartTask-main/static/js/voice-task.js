@@ -100,6 +100,67 @@ async function toggleRecording() {
     }
 }
 
+/**
+ * Poll a queued voice command until it has been processed
+ */
+function pollVoiceTask(statusUrl) {
+    return new Promise(resolve => setTimeout(resolve, 1000))
+        .then(() => fetch(statusUrl))
+        .then(response => response.json())
+        .then(data => data.status === 'pending' ? pollVoiceTask(statusUrl) : data);
+}
+
+/**
+ * Convert a recording to 16 kHz mono 16-bit WAV, which the server can
+ * transcribe and parse in a single model call
+ */
+async function encodeWav(blob) {
+    const sampleRate = 16000;
+    
+    const audioContext = new AudioContext();
+    let decoded;
+    try {
+        decoded = await audioContext.decodeAudioData(await blob.arrayBuffer());
+    } finally {
+        audioContext.close();
+    }
+    
+    // Downmix to mono and resample
+    const offline = new OfflineAudioContext(1, Math.ceil(decoded.duration * sampleRate), sampleRate);
+    const source = offline.createBufferSource();
+    source.buffer = decoded;
+    source.connect(offline.destination);
+    source.start();
+    const samples = (await offline.startRendering()).getChannelData(0);
+    
+    // 44-byte PCM WAV header followed by the samples
+    const view = new DataView(new ArrayBuffer(44 + samples.length * 2));
+    const writeString = (offset, text) => {
+        for (let i = 0; i < text.length; i++) {
+            view.setUint8(offset + i, text.charCodeAt(i));
+        }
+    };
+    writeString(0, 'RIFF');
+    view.setUint32(4, 36 + samples.length * 2, true);
+    writeString(8, 'WAVE');
+    writeString(12, 'fmt ');
+    view.setUint32(16, 16, true);              // fmt chunk size
+    view.setUint16(20, 1, true);               // PCM
+    view.setUint16(22, 1, true);               // mono
+    view.setUint32(24, sampleRate, true);
+    view.setUint32(28, sampleRate * 2, true);  // byte rate
+    view.setUint16(32, 2, true);               // block align
+    view.setUint16(34, 16, true);              // bits per sample
+    writeString(36, 'data');
+    view.setUint32(40, samples.length * 2, true);
+    for (let i = 0; i < samples.length; i++) {
+        const sample = Math.max(-1, Math.min(1, samples[i]));
+        view.setInt16(44 + i * 2, sample < 0 ? sample * 0x8000 : sample * 0x7fff, true);
+    }
+    
+    return new Blob([view], { type: 'audio/wav' });
+}
+
 /**
  * Process the recorded audio
  */
@@ -109,44 +170,50 @@ function processRecording() {
     // Create audio blob from chunks
     const audioBlob = new Blob(audioChunks, { type: 'audio/webm' });
     
-    // Convert blob to base64
-    const reader = new FileReader();
-    reader.readAsDataURL(audioBlob);
-    
-    reader.onloadend = function() {
-        const base64Audio = reader.result;
+    // Send WAV when the browser can decode the recording, the original otherwise
+    encodeWav(audioBlob)
+    .then(wavBlob => ({ blob: wavBlob, filename: 'voice-command.wav' }))
+    .catch(() => ({ blob: audioBlob, filename: 'voice-command.webm' }))
+    .then(({ blob, filename }) => {
+        // Upload the recording as a file rather than a base64 data URL
+        const formData = new FormData();
+        formData.append('audio', blob, filename);
         
         // Send to backend for processing
-        fetch('/api/voice-task', {
+        return fetch('/api/voice-task', {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ audio: base64Audio })
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                // Display transcript
-                document.getElementById('voice-task-transcript').textContent = data.transcript;
-                
-                // Populate form with extracted information
-                populateTaskForm(data.task_info);
-                
-                // Show the form
-                document.getElementById('voice-task-form').classList.remove('d-none');
-                
-                // Update feedback
-                feedbackElement.innerHTML = '<div class="alert alert-success">Voice command processed successfully! Review and submit the task.</div>';
-            } else {
-                feedbackElement.innerHTML = `<div class="alert alert-danger">Error: ${data.error}</div>`;
-            }
-        })
-        .catch(error => {
-            console.error('Error processing voice command:', error);
-            feedbackElement.innerHTML = '<div class="alert alert-danger">Error processing voice command. Please try again.</div>';
+            body: formData
         });
-    };
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success || !data.status_url) {
+            return data;
+        }
+        // The command is processed in the background; poll until it's done
+        return pollVoiceTask(data.status_url);
+    })
+    .then(data => {
+        if (data.success) {
+            // Display transcript
+            document.getElementById('voice-task-transcript').textContent = data.transcript;
+            
+            // Populate form with extracted information
+            populateTaskForm(data.task_info);
+            
+            // Show the form
+            document.getElementById('voice-task-form').classList.remove('d-none');
+            
+            // Update feedback
+            feedbackElement.innerHTML = '<div class="alert alert-success">Voice command processed successfully! Review and submit the task.</div>';
+        } else {
+            feedbackElement.innerHTML = `<div class="alert alert-danger">Error: ${data.error}</div>`;
+        }
+    })
+    .catch(error => {
+        console.error('Error processing voice command:', error);
+        feedbackElement.innerHTML = '<div class="alert alert-danger">Error processing voice command. Please try again.</div>';
+    });
 }
 
 /**
@@ -1,23 +1,137 @@
 import os
-import json
+import base64
+import hashlib
+import re
+import atexit
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, timezone
 from flask import current_app
 from flask_mail import Message
-from app import mail
-from openai import OpenAI
+from app import db, mail, cache
+from models import Notification
+import httpx
+import orjson
+from openai import DefaultHttpxClient, OpenAI
+from ratelimit import RateLimiter
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# One connection pool shared by every thread and greenlet in the worker, so calls
+# reuse warm keep-alive connections to the API instead of each paying for a new
+# TCP and TLS handshake
+openai_http_client = DefaultHttpxClient(
+    limits=httpx.Limits(
+        max_connections=int(os.environ.get("OPENAI_MAX_CONNECTIONS", 64)),
+        max_keepalive_connections=int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 32)),
+    ),
+)
+
+# Initialize OpenAI client for calls a user is waiting on; keeps the SDK's default
+# retries and a read timeout short enough that a request gives up well within the
+# gunicorn worker timeout
+openai_client = OpenAI(
+    api_key=os.environ.get("OPENAI_API_KEY"),
+    timeout=httpx.Timeout(float(os.environ.get("OPENAI_TIMEOUT", 30)), connect=5.0),
+    http_client=openai_http_client,
+)
+
+# Same client for bulk and Batch API work nobody is waiting on; the SDK retries rate
+# limits, timeouts and 5xx errors itself with exponential backoff, honouring Retry-After
+openai_bulk_client = openai_client.with_options(
+    max_retries=int(os.environ.get("OPENAI_BULK_MAX_RETRIES", 5)),
+    timeout=httpx.Timeout(120.0, connect=5.0),
+)
+
+# Client-side limits so bulk work paces itself instead of running into 429s. They
+# apply per worker process, so set them to the account limits divided by the
+# number of workers; unset means unlimited.
+openai_rate_limiter = RateLimiter(
+    requests_per_minute=int(os.environ["OPENAI_RPM_LIMIT"]) if os.environ.get("OPENAI_RPM_LIMIT") else None,
+    tokens_per_minute=int(os.environ["OPENAI_TPM_LIMIT"]) if os.environ.get("OPENAI_TPM_LIMIT") else None,
+)
+
+
+def _estimate_tokens(prompt, max_tokens):
+    """Rough token count of a chat request (about 4 characters per token plus the system prompt)"""
+    return len(prompt) // 4 + 50 + max_tokens
+
+
+# Outgoing emails are sent by a background thread so requests don't wait on SMTP
+MAIL_SHUTDOWN_TIMEOUT = 10  # seconds to keep sending queued emails at worker shutdown
+_mail_queue = queue.Queue()
+_mail_thread = None
+_mail_thread_lock = threading.Lock()
+
+
+def _mail_worker(app):
+    """
+    Send queued messages, reusing one SMTP connection for each burst
+    
+    Args:
+        app: Flask application the messages are sent for
+    """
+    while True:
+        msg = _mail_queue.get()
+        with app.app_context():
+            try:
+                with mail.connect() as conn:
+                    while msg is not None:
+                        conn.send(msg)
+                        msg = None
+                        _mail_queue.task_done()
+                        try:
+                            msg = _mail_queue.get_nowait()
+                        except queue.Empty:
+                            pass
+            except Exception as e:
+                app.logger.error(f"Failed to send email: {str(e)}")
+                if msg is not None:
+                    _mail_queue.task_done()
+
+
+def _flush_mail_queue():
+    """Wait (bounded) for queued emails to be sent before the process exits"""
+    deadline = time.monotonic() + MAIL_SHUTDOWN_TIMEOUT
+    while (_mail_queue.unfinished_tasks and _mail_thread is not None and _mail_thread.is_alive()
+           and time.monotonic() < deadline):
+        time.sleep(0.1)
+
+
+atexit.register(_flush_mail_queue)
+
+
+def _ensure_mail_worker():
+    """Start the mail thread on first use (and again in forked worker processes)"""
+    global _mail_thread
+    with _mail_thread_lock:
+        if _mail_thread is None or not _mail_thread.is_alive():
+            _mail_thread = threading.Thread(
+                target=_mail_worker,
+                args=(current_app._get_current_object(),),
+                name="mail-sender",
+                daemon=True
+            )
+            _mail_thread.start()
 
 
 def send_task_notification_email(to, subject, body):
     """
-    Send task-related email notifications to users
+    Queue task-related email notifications to users
+    
+    The message is sent by a background thread, so this returns as soon as it
+    has been queued.
     
     Args:
         to (str): Recipient email address
         subject (str): Email subject
         body (str): Email body content
+        
+    Returns:
+        bool: True once the message is queued; SMTP errors are only logged by the sender thread
     """
     if not to:
         current_app.logger.error("No recipient email provided")
@@ -30,11 +144,211 @@ def send_task_notification_email(to, subject, body):
             body=body,
             sender=current_app.config.get('MAIL_DEFAULT_SENDER')
         )
-        mail.send(msg)
+        _ensure_mail_worker()
+        _mail_queue.put(msg)
         return True
     except Exception as e:
-        current_app.logger.error(f"Failed to send email: {str(e)}")
+        current_app.logger.error(f"Failed to queue email: {str(e)}")
+        return False
+
+
+# Recipients per BCC message; stays under typical SMTP per-message recipient limits
+MAIL_BCC_BATCH_SIZE = 50
+
+
+def send_task_notification_email_bulk(recipients, subject, body):
+    """
+    Queue the same task email for several users as BCC messages
+    
+    One message goes out per MAIL_BCC_BATCH_SIZE recipients instead of one per
+    recipient, and the sender thread delivers them over a shared SMTP connection.
+    
+    Args:
+        recipients (list): Recipient email addresses
+        subject (str): Email subject
+        body (str): Email body content
+        
+    Returns:
+        bool: True once the messages are queued
+    """
+    recipients = list(dict.fromkeys(r for r in recipients if r))
+    if not recipients:
+        current_app.logger.error("No recipient email provided")
         return False
+    
+    try:
+        sender = current_app.config.get('MAIL_DEFAULT_SENDER')
+        _ensure_mail_worker()
+        for start in range(0, len(recipients), MAIL_BCC_BATCH_SIZE):
+            # Addressed to the sender so recipients don't see each other
+            _mail_queue.put(Message(
+                subject=subject,
+                recipients=[sender],
+                bcc=recipients[start:start + MAIL_BCC_BATCH_SIZE],
+                body=body,
+                sender=sender
+            ))
+        return True
+    except Exception as e:
+        current_app.logger.error(f"Failed to queue email: {str(e)}")
+        return False
+
+
+# Background thread pools by name; threads are greenlets under the gevent worker
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(name, max_workers):
+    """
+    Get a named thread pool, creating it on first use (and again in forked worker processes)
+    
+    Args:
+        name (str): Pool name, also used as the thread name prefix
+        max_workers (int): Number of threads in the pool
+        
+    Returns:
+        ThreadPoolExecutor: The pool
+    """
+    with _executors_lock:
+        executor, pid = _executors.get(name, (None, None))
+        if executor is None or pid != os.getpid():
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+            _executors[name] = (executor, os.getpid())
+        return executor
+
+
+def _call_in_app_context(app, func, args):
+    with app.app_context():
+        return func(*args)
+
+
+def create_notifications(user_ids, title, message, task_id=None):
+    """
+    Create the same notification for several users with a single multi-row INSERT
+    
+    The caller is responsible for committing the session and then calling
+    invalidate_unread_count(), so no stale count is cached in between.
+    
+    Args:
+        user_ids (list): Ids of the users to notify
+        title (str): Notification title
+        message (str): Notification message
+        task_id (int, optional): Id of the related task
+    """
+    rows = [
+        {'user_id': user_id, 'title': title, 'message': message, 'task_id': task_id}
+        for user_id in user_ids
+    ]
+    if rows:
+        db.session.execute(db.insert(Notification), rows)
+
+
+# Badge counts are polled by every page load, so a few seconds of staleness is fine
+UNREAD_COUNT_TIMEOUT = 5
+
+
+def _unread_count_key(user_id):
+    return f'unread:{user_id}'
+
+
+def get_unread_notification_count(user_id):
+    """
+    Get the number of unread notifications for a user, cached for a few seconds
+    
+    Args:
+        user_id (int): Id of the user
+        
+    Returns:
+        int: Number of unread notifications
+    """
+    key = _unread_count_key(user_id)
+    try:
+        count = cache.get(key)
+    except Exception as e:
+        current_app.logger.warning(f"Unread count cache unavailable: {str(e)}")
+        count = None
+    if count is None:
+        count = db.session.query(db.func.count(Notification.id)).filter_by(
+            user_id=user_id, is_read=False
+        ).scalar()
+        try:
+            cache.set(key, count, timeout=UNREAD_COUNT_TIMEOUT)
+        except Exception as e:
+            current_app.logger.warning(f"Unread count cache unavailable: {str(e)}")
+    return count
+
+
+def invalidate_unread_count(*user_ids):
+    """
+    Drop cached unread counts so the next badge fetch sees new or read notifications
+    
+    Args:
+        *user_ids (int): Ids of the users whose counts changed
+    """
+    if user_ids:
+        try:
+            cache.delete_many(*(_unread_count_key(user_id) for user_id in user_ids))
+        except Exception as e:
+            current_app.logger.warning(f"Unread count cache unavailable: {str(e)}")
+
+
+# Bytes read and written per chunk when saving uploaded files
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Stored files get the same permissions a plain open() would give them, so the web
+# server can read them for X-Accel-Redirect/X-Sendfile. The umask can only be read
+# by setting it, so do that once at import rather than per upload across threads.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+UPLOAD_FILE_MODE = 0o666 & ~_UMASK
+
+
+def save_upload(stream):
+    """
+    Save an uploaded file under the SHA-256 of its contents
+    
+    The file is hashed while it is streamed to a temporary file, then moved
+    into place; when the same bytes were uploaded before, the existing copy
+    is reused and the new one discarded.
+    
+    Args:
+        stream: File-like object with the uploaded data
+        
+    Returns:
+        str: Storage name of the file, relative to UPLOAD_FOLDER
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    digest = hashlib.sha256()
+    
+    # Write next to the final location so the move below is a rename
+    with tempfile.NamedTemporaryFile(dir=upload_folder, prefix='.upload-', delete=False, buffering=0) as out:
+        try:
+            while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+                out.write(chunk)
+        except BaseException:
+            # Don't leave a partial upload behind, e.g. when the client disconnects
+            os.unlink(out.name)
+            raise
+    
+    hexdigest = digest.hexdigest()
+    filename = f"{hexdigest[:2]}/{hexdigest}"
+    file_path = os.path.join(upload_folder, filename)
+    
+    if os.path.exists(file_path):
+        os.unlink(out.name)
+    else:
+        # NamedTemporaryFile creates files as 0600, and the rename would keep that
+        os.chmod(out.name, UPLOAD_FILE_MODE)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(out.name, file_path)
+    return filename
+
+
+# Display timezone for format_datetime; built once rather than on every call
+IST = timezone(timedelta(hours=5, minutes=30), name="IST")
+IST_FORMAT = "%d %b, %Y - %H:%M IST"
 
 
 def format_datetime(dt):
@@ -50,14 +364,16 @@ def format_datetime(dt):
     if not dt:
         return "N/A"
     
-    # Convert to IST timezone (UTC+5:30)
-    ist_offset = timedelta(hours=5, minutes=30)
-    if dt.tzinfo is None:  # If datetime is naive
-        dt_ist = dt + ist_offset
-    else:
-        dt_ist = dt.astimezone(timezone(ist_offset))
+    # Convert to IST timezone (UTC+5:30); naive datetimes are stored in UTC
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
         
-    return dt_ist.strftime("%d %b, %Y - %H:%M IST")
+    return dt.astimezone(IST).strftime(IST_FORMAT)
+
+
+# Bootstrap badge classes by priority and status; anything else gets the default
+PRIORITY_BADGE_CLASSES = {"high": "bg-danger", "medium": "bg-warning"}
+STATUS_BADGE_CLASSES = {"completed": "bg-success", "in-progress": "bg-primary"}
 
 
 def get_priority_badge_class(priority):
@@ -70,12 +386,7 @@ def get_priority_badge_class(priority):
     Returns:
         str: CSS class for the badge
     """
-    if priority == "high":
-        return "bg-danger"
-    elif priority == "medium":
-        return "bg-warning"
-    else:
-        return "bg-info"
+    return PRIORITY_BADGE_CLASSES.get(priority, "bg-info")
 
 
 def get_status_badge_class(status):
@@ -88,12 +399,173 @@ def get_status_badge_class(status):
     Returns:
         str: CSS class for the badge
     """
-    if status == "completed":
-        return "bg-success"
-    elif status == "in-progress":
-        return "bg-primary"
-    else:
-        return "bg-secondary"
+    return STATUS_BADGE_CLASSES.get(status, "bg-secondary")
+
+
+# Identical AI requests come up again and again while admins fill in task forms,
+# so successful answers are cached by a hash of their inputs
+AI_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+AI_LOCAL_CACHE_SIZE = 1024  # entries kept in each worker in front of the shared cache
+_ai_local_cache = OrderedDict()
+_ai_local_cache_lock = threading.Lock()
+
+
+def _ai_cache_key(kind, *inputs):
+    digest = hashlib.sha256(orjson.dumps(inputs)).hexdigest()
+    return f'ai:{kind}:{digest}'
+
+
+def _normalize_for_cache(text):
+    """
+    Reduce text to the words that matter for a cached AI answer
+    
+    Case, punctuation and spacing differences ("Draft NDA, urgent!" vs
+    "draft nda urgent") don't change the model's answer, so they share a key.
+    
+    Args:
+        text (str): Text sent to the model
+        
+    Returns:
+        str: Normalized text
+    """
+    return ' '.join(re.findall(r'\w+', (text or '').casefold()))
+
+
+def _ai_cache_get(key):
+    """
+    Look up a cached AI result, in this process first and then in the shared cache
+    
+    Args:
+        key (str): Key from _ai_cache_key()
+        
+    Returns:
+        The cached result, or None on a miss
+    """
+    with _ai_local_cache_lock:
+        entry = _ai_local_cache.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                _ai_local_cache.move_to_end(key)
+                return value
+            del _ai_local_cache[key]
+    
+    try:
+        value = cache.get(key)
+    except Exception as e:
+        current_app.logger.warning(f"AI cache unavailable: {str(e)}")
+        return None
+    if value is not None:
+        # Kept locally for a full timeout, so it can outlive the shared entry by up to that
+        _ai_local_cache_put(key, value)
+    return value
+
+
+def _ai_cache_set(key, value):
+    """
+    Cache an AI result in this process and in the shared cache
+    
+    Args:
+        key (str): Key from _ai_cache_key()
+        value: Result to cache
+    """
+    _ai_local_cache_put(key, value)
+    try:
+        cache.set(key, value, timeout=AI_CACHE_TIMEOUT)
+    except Exception as e:
+        current_app.logger.warning(f"AI cache unavailable: {str(e)}")
+
+
+def _ai_local_cache_put(key, value):
+    with _ai_local_cache_lock:
+        _ai_local_cache[key] = (time.monotonic() + AI_CACHE_TIMEOUT, value)
+        _ai_local_cache.move_to_end(key)
+        while len(_ai_local_cache) > AI_LOCAL_CACHE_SIZE:
+            _ai_local_cache.popitem(last=False)
+
+
+# Prompt scaffolding for the task description requests. The system prompt is the
+# same for every request, so OpenAI's prompt caching can reuse it as a prefix; the
+# service type goes in the user message.
+TASK_DESCRIPTION_SYSTEM_PROMPT = (
+    "You are a professional task description generator. "
+    "Create clear, concise task descriptions that follow the industry standards of the requested service type.\n"
+    "Format the response as JSON with 'title' (max 10 words) and 'description' (2-3 paragraphs) fields."
+)
+
+# Structured output schema for task descriptions; with strict mode the model can
+# only produce these two fields
+TASK_DESCRIPTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+    },
+    "required": ["title", "description"],
+    "additionalProperties": False,
+}
+
+
+def _task_description_request(service_type, keywords, client_name=None, priority=None):
+    """
+    Build the chat completion arguments for generating a task description
+    
+    Args:
+        service_type (str): Type of service (Legal, Consulting, IT, etc.)
+        keywords (str): Keywords or brief description of the task
+        client_name (str, optional): Name of the client
+        priority (str, optional): Priority level (low, medium, high)
+        
+    Returns:
+        dict: Keyword arguments for chat.completions.create(), also used as a Batch API request body
+    """
+    # Build the prompt with available information
+    prompt = f"Generate a professional {service_type} task"
+    if client_name:
+        prompt += f" for client {client_name}"
+    if priority:
+        prompt += f" with {priority} priority"
+    prompt += f". Task keywords: {keywords}"
+    
+    # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
+    # do not change this unless explicitly requested by the user
+    return {
+        'model': "gpt-4o",
+        'messages': [
+            {"role": "system", "content": TASK_DESCRIPTION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        'response_format': {
+            "type": "json_schema",
+            "json_schema": {"name": "task_description", "schema": TASK_DESCRIPTION_SCHEMA, "strict": True}
+        },
+        'temperature': 0.7,
+        'max_tokens': 500
+    }
+
+
+def _parse_task_description(content):
+    """
+    Parse the model's answer to a task description request
+    
+    Args:
+        content (str): Message content returned by the model
+        
+    Returns:
+        dict: Generated task title and description
+    """
+    if content is None:
+        raise ValueError("No content received from AI")
+    
+    # The response schema guarantees both fields
+    result = orjson.loads(content)
+    return {
+        'title': result['title'],
+        'description': result['description'],
+        'success': True
+    }
 
 
 def generate_ai_task_description(service_type, keywords, client_name=None, priority=None):
@@ -109,45 +581,25 @@ def generate_ai_task_description(service_type, keywords, client_name=None, prior
     Returns:
         dict: Generated task title and description
     """
+    return _generate_task_description(openai_client, service_type, keywords, client_name, priority)
+
+
+def _generate_task_description(client, service_type, keywords, client_name, priority):
+    # generate_ai_task_description() on the given OpenAI client, so bulk generation can use the retrying one
+    cache_key = _ai_cache_key('description', service_type, keywords, client_name, priority)
+    cached = _ai_cache_get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        # Build the prompt with available information
-        prompt = f"Generate a professional {service_type} task"
-        if client_name:
-            prompt += f" for client {client_name}"
-        if priority:
-            prompt += f" with {priority} priority"
-        prompt += f". Task keywords: {keywords}"
-        prompt += "\nFormat the response as JSON with 'title' (max 10 words) and 'description' (2-3 paragraphs) fields."
-        
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": f"You are a professional {service_type} task description generator. Create clear, concise task descriptions that follow industry standards."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.7,
-            max_tokens=500
-        )
+        request_args = _task_description_request(service_type, keywords, client_name, priority)
+        openai_rate_limiter.acquire(_estimate_tokens(request_args['messages'][1]['content'], request_args['max_tokens']))
+        response = client.chat.completions.create(**request_args)
         
         # Parse the response
-        content = response.choices[0].message.content
-        if content is not None:
-            result = json.loads(content)
-            
-            # Ensure we have the required fields
-            if 'title' not in result or 'description' not in result:
-                raise ValueError("AI response missing required fields")
-        else:
-            raise ValueError("No content received from AI")
-            
-        return {
-            'title': result['title'],
-            'description': result['description'],
-            'success': True
-        }
+        generated = _parse_task_description(response.choices[0].message.content)
+        _ai_cache_set(cache_key, generated)
+        return generated
     except Exception as e:
         current_app.logger.error(f"Error generating AI task description: {str(e)}")
         return {
@@ -158,6 +610,84 @@ def generate_ai_task_description(service_type, keywords, client_name=None, prior
         }
 
 
+def submit_task_description_batch(records):
+    """
+    Queue task description requests with the OpenAI Batch API
+    
+    Batches cost half as much as interactive calls and have their own rate
+    limits, but finish within 24 hours, so they suit backfills and imports.
+    
+    Args:
+        records (list): Dicts with an 'id' plus the generate_ai_task_description()
+            arguments 'service_type', 'keywords' and optionally 'client_name' and 'priority'
+        
+    Returns:
+        str: Batch id to pass to fetch_task_description_batch()
+    """
+    lines = [
+        orjson.dumps({
+            'custom_id': str(record['id']),
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': _task_description_request(
+                record['service_type'], record['keywords'], record.get('client_name'), record.get('priority')
+            )
+        })
+        for record in records
+    ]
+    batch_file = openai_bulk_client.files.create(
+        file=('task-descriptions.jsonl', b'\n'.join(lines)),
+        purpose='batch'
+    )
+    batch = openai_bulk_client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint='/v1/chat/completions',
+        completion_window='24h'
+    )
+    return batch.id
+
+
+def fetch_task_description_batch(batch_id):
+    """
+    Collect the results of a task description batch
+    
+    Args:
+        batch_id (str): Id returned by submit_task_description_batch()
+        
+    Returns:
+        tuple: (status, results) where results maps each record id to a
+            generate_ai_task_description()-style dict, or is None while the
+            batch is still running
+    """
+    batch = openai_bulk_client.batches.retrieve(batch_id)
+    if batch.status in ('validating', 'in_progress', 'finalizing', 'cancelling'):
+        return batch.status, None
+    
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in openai_bulk_client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            entry = orjson.loads(line)
+            response = entry.get('response') or {}
+            try:
+                if entry.get('error') or response.get('status_code') != 200:
+                    raise ValueError(f"Request failed: {entry.get('error') or response.get('body')}")
+                results[entry['custom_id']] = _parse_task_description(
+                    response['body']['choices'][0]['message']['content']
+                )
+            except Exception as e:
+                results[entry['custom_id']] = {
+                    'title': '',
+                    'description': '',
+                    'success': False,
+                    'error': str(e)
+                }
+    return batch.status, results
+
+
 def analyze_task_priority(task_description, deadline_days=None):
     """
     Analyze task description to suggest appropriate priority
@@ -169,99 +699,402 @@ def analyze_task_priority(task_description, deadline_days=None):
     Returns:
         str: Suggested priority (low, medium, high)
     """
+    return analyze_task_priority_batch([(task_description, deadline_days)])[0]
+
+
+# Tasks analyzed per chat completion; keeps the JSON answer well under max_tokens
+PRIORITY_BATCH_SIZE = 50
+PRIORITY_MODEL = os.environ.get("OPENAI_PRIORITY_MODEL", "gpt-4o-mini")
+PRIORITIES = frozenset({'low', 'medium', 'high'})
+
+
+def analyze_task_priority_batch(tasks):
+    """
+    Suggest priorities for several tasks, sharing one chat completion per batch
+    
+    Cached answers are reused, and the remaining tasks are sent together in
+    batches of PRIORITY_BATCH_SIZE.
+    
+    Args:
+        tasks (list): (task_description, deadline_days) pairs; deadline_days may be None
+        
+    Returns:
+        list: Suggested priority (low, medium, high) for each task, in order
+    """
+    priorities = [None] * len(tasks)
+    cache_keys = []
+    misses = []
+    for i, (task_description, deadline_days) in enumerate(tasks):
+        cache_key = _ai_cache_key('priority', _normalize_for_cache(task_description), deadline_days)
+        cache_keys.append(cache_key)
+        priorities[i] = _ai_cache_get(cache_key)
+        if priorities[i] is None:
+            misses.append(i)
+    
+    for start in range(0, len(misses), PRIORITY_BATCH_SIZE):
+        batch = misses[start:start + PRIORITY_BATCH_SIZE]
+        for i, suggested_priority in zip(batch, _request_task_priorities([tasks[i] for i in batch])):
+            if suggested_priority is not None:
+                _ai_cache_set(cache_keys[i], suggested_priority)
+                priorities[i] = suggested_priority
+    
+    # Default to medium for any task the model gave no valid answer for
+    return [priority or 'medium' for priority in priorities]
+
+
+def _valid_priority(value):
+    # Normalized priority if the model answered 'low', 'medium' or 'high', else None
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in PRIORITIES:
+            return value
+    return None
+
+
+# Prompt scaffolding for the priority requests
+PRIORITY_SYSTEM_PROMPT = (
+    "You are a task priority analyzer. Rate each task 'low', 'medium', or 'high' based on task urgency and importance."
+)
+PRIORITY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "priorities": {"type": "array", "items": {"type": "string", "enum": ["low", "medium", "high"]}},
+    },
+    "required": ["priorities"],
+    "additionalProperties": False,
+}
+PRIORITY_PROMPT = (
+    "Analyze each task description below and recommend a priority level (low, medium, or high) for each.\n"
+    "Respond with JSON in the form {\"priorities\": [...]}, with exactly one entry per task, in order.\n\n"
+)
+
+
+def _request_task_priorities(tasks):
+    """
+    Ask the model for the priority of each task in a single request
+    
+    Args:
+        tasks (list): (task_description, deadline_days) pairs
+        
+    Returns:
+        list: 'low', 'medium' or 'high' per task, or None where the answer was invalid
+    """
     try:
         # Build the prompt with available information
-        prompt = f"Analyze this task description and recommend a priority level (low, medium, or high):\n\n{task_description}"
-        if deadline_days is not None:
-            prompt += f"\n\nThe deadline for this task is {deadline_days} days from now."
-            
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
-        # do not change this unless explicitly requested by the user
+        items = []
+        for i, (task_description, deadline_days) in enumerate(tasks, start=1):
+            item = f"Task {i}:\n{task_description}"
+            if deadline_days is not None:
+                item += f"\nThe deadline for this task is {deadline_days} days from now."
+            items.append(item)
+        
+        prompt = PRIORITY_PROMPT + "\n\n".join(items)
+        
+        # A three-way classification doesn't need the full model
+        max_tokens = 50 + 10 * len(tasks)
+        openai_rate_limiter.acquire(_estimate_tokens(prompt, max_tokens))
         response = openai_client.chat.completions.create(
-            model="gpt-4o",
+            model=PRIORITY_MODEL,
             messages=[
-                {"role": "system", "content": "You are a task priority analyzer. Respond with only 'low', 'medium', or 'high' based on task urgency and importance."},
+                {"role": "system", "content": PRIORITY_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.3,
-            max_tokens=50
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "task_priorities", "schema": PRIORITY_SCHEMA, "strict": True}
+            },
+            temperature=0,
+            max_tokens=max_tokens
         )
         
-        # Get the suggested priority
+        # Parse the response
         content = response.choices[0].message.content
-        if content is not None:
-            suggested_priority = content.strip().lower()
-            
-            # Validate and return the priority
-            if suggested_priority in ['low', 'medium', 'high']:
-                return suggested_priority
-            
-        # Default to medium if response is invalid or empty
-        return 'medium'
-            
+        if content is None:
+            raise ValueError("No content received from AI")
+        
+        suggested = orjson.loads(content).get('priorities')
+        if not isinstance(suggested, list) or len(suggested) != len(tasks):
+            raise ValueError("AI response does not have one priority per task")
+        
+        # Validate each priority
+        return [_valid_priority(priority) for priority in suggested]
     except Exception as e:
         current_app.logger.error(f"Error analyzing task priority: {str(e)}")
-        # Default to medium on error
-        return 'medium'
+        return [None] * len(tasks)
+
+
+# Independent AI calls made together wait on OpenAI at the same time
+AI_CALL_WORKERS = int(os.environ.get("AI_CALL_WORKERS", 8))
+
+
+def run_ai_calls(*calls):
+    """
+    Run independent AI helper calls concurrently and wait for all of them
+    
+    K calls take about as long as the slowest one instead of the sum of all.
+    
+    Args:
+        *calls: (function, args) pairs, e.g. (analyze_task_priority, (description, 3))
+        
+    Returns:
+        list: Each call's result, in the order given
+    """
+    app = current_app._get_current_object()
+    executor = _get_executor('ai-call', AI_CALL_WORKERS)
+    futures = [executor.submit(_call_in_app_context, app, func, args) for func, args in calls]
+    return [future.result() for future in futures]
+
+
+def generate_ai_task_descriptions_bulk(items):
+    """
+    Generate many task descriptions, AI_CALL_WORKERS at a time within the rate limits
+    
+    Args:
+        items (list): Dicts with 'service_type' and 'keywords', and optionally
+            'client_name' and 'priority'
+        
+    Returns:
+        list: generate_ai_task_description() result for each item, in order
+    """
+    return run_ai_calls(*(
+        (_generate_task_description,
+         (openai_bulk_client, item['service_type'], item['keywords'], item.get('client_name'), item.get('priority')))
+        for item in items
+    ))
+
+
+# With a shared cache (VOICE_JOBS_ASYNC), voice commands are transcribed and parsed
+# by a small pool of background threads, and results are kept in the cache until
+# the browser's status poll picks them up from any worker
+VOICE_JOB_TIMEOUT = 600  # seconds a finished job's result is kept
+VOICE_WORKERS = int(os.environ.get("VOICE_WORKERS", 4))
+
+
+def _voice_job_key(job_id):
+    return f'voice-job:{job_id}'
+
+
+def _run_voice_job(app, job_id, user_id, audio, mime_type):
+    """
+    Process a queued voice command and store the result for polling
+    
+    Args:
+        app: Flask application the job runs for
+        job_id (str): Id of the job
+        user_id (int): Id of the user who submitted it
+        audio (str or bytes): Audio as passed to process_voice_command()
+        mime_type (str): MIME type of raw audio bytes
+    """
+    with app.app_context():
+        result = process_voice_command(audio, mime_type)
+        result.update(status='done', user_id=user_id)
+        cache.set(_voice_job_key(job_id), result, timeout=VOICE_JOB_TIMEOUT)
 
 
-def process_voice_command(audio_base64):
+def submit_voice_command(audio, user_id, mime_type=None):
+    """
+    Queue a voice command to be processed in the background
+    
+    Args:
+        audio (str or bytes): Base64 encoded audio data or data URL, or the raw uploaded bytes
+        user_id (int): Id of the user submitting the command
+        mime_type (str, optional): MIME type of raw audio bytes
+        
+    Returns:
+        str: Job id to poll with get_voice_job()
+    """
+    job_id = uuid.uuid4().hex
+    cache.set(_voice_job_key(job_id), {'status': 'pending', 'user_id': user_id}, timeout=VOICE_JOB_TIMEOUT)
+    _get_executor('voice-job', VOICE_WORKERS).submit(
+        _run_voice_job, current_app._get_current_object(), job_id, user_id, audio, mime_type
+    )
+    return job_id
+
+
+def get_voice_job(job_id):
+    """
+    Get the state of a queued voice command
+    
+    Args:
+        job_id (str): Id returned by submit_voice_command()
+        
+    Returns:
+        dict: Job state with 'status' ('pending' or 'done') and 'user_id', plus the
+            process_voice_command() result once done; None if the job is unknown
+    """
+    return cache.get(_voice_job_key(job_id))
+
+
+# Fields the model extracts from a voice command, shared by both voice paths
+VOICE_TASK_FIELDS = (
+    "Parse each voice command into JSON format with the following fields:\n"
+    "1. title: The task title (create a concise, professional title based on the context)\n"
+    "2. description: Detailed task description (expand on what was mentioned to create a comprehensive task description)\n"
+    "3. service_type: Type of service (e.g., Legal, IT, Consulting, Design, etc.)\n"
+    "4. priority: Task priority (low, medium, high - infer based on urgency words or task importance)\n"
+    "5. client_name: Name of the client (exact name as mentioned)\n"
+    "6. deadline: Suggested deadline in days from now (if mentioned or can be reasonably inferred)\n"
+)
+VOICE_TASK_GUIDANCE = (
+    "Always extract as much detail as possible from the voice command. If specific information isn't provided, "
+    "make a reasonable inference based on the context of the task."
+)
+
+# Structured output schema for voice commands, matching VOICE_TASK_FIELDS. The
+# audio model isn't documented to support structured outputs, so the single-call
+# path asks for a plain JSON object instead.
+VOICE_TASK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "description": {"type": "string"},
+        "service_type": {"type": "string"},
+        "priority": {"type": "string", "enum": ["low", "medium", "high"]},
+        "client_name": {"type": "string"},
+        "deadline": {"type": ["integer", "null"]},
+    },
+    "required": ["title", "description", "service_type", "priority", "client_name", "deadline"],
+    "additionalProperties": False,
+}
+
+# The instructions live in the system prompts so that every request starts with
+# the same prefix for OpenAI's prompt caching; only the command itself varies
+VOICE_SYSTEM_PROMPT = (
+    "You are an assistant that extracts task information from voice commands.\n"
+    + VOICE_TASK_FIELDS
+    + VOICE_TASK_GUIDANCE
+)
+VOICE_AUDIO_SYSTEM_PROMPT = (
+    "You are an assistant that extracts task information from voice commands.\n"
+    + VOICE_TASK_FIELDS
+    + "7. transcript: Verbatim transcript of the recording\n"
+    + VOICE_TASK_GUIDANCE
+)
+VOICE_TRANSCRIPT_PROMPT = "Extract task information from this voice command: '{transcript}'"
+VOICE_AUDIO_PROMPT = "Extract task information from the voice command in this recording."
+
+# Audio the audio-capable chat model accepts directly, by MIME type. The voice
+# recorder converts to wav for this; anything else (such as webm from browsers that
+# can't decode their own recording) goes through Whisper.
+FUSED_AUDIO_FORMATS = {
+    'audio/wav': 'wav',
+    'audio/x-wav': 'wav',
+    'audio/wave': 'wav',
+    'audio/mpeg': 'mp3',
+    'audio/mp3': 'mp3',
+}
+
+
+def _process_voice_command_fused(audio_base64, audio_format):
+    """
+    Transcribe a voice command and extract its task details in one chat completion
+    
+    Args:
+        audio_base64 (str): Base64 encoded audio data, without a data URL prefix
+        audio_format (str): 'wav' or 'mp3'
+        
+    Returns:
+        dict: Processed task details
+    """
+    openai_rate_limiter.acquire(_estimate_tokens(VOICE_AUDIO_SYSTEM_PROMPT, 700) + len(audio_base64) // 100)
+    response = openai_client.chat.completions.create(
+        model="gpt-4o-audio-preview",
+        modalities=["text"],
+        messages=[
+            {
+                "role": "system",
+                "content": VOICE_AUDIO_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": [
+                    {"type": "input_audio", "input_audio": {"data": audio_base64, "format": audio_format}},
+                    {"type": "text", "text": VOICE_AUDIO_PROMPT}
+                ]
+            }
+        ],
+        response_format={"type": "json_object"},
+        temperature=0.3,
+        max_tokens=700
+    )
+    
+    # Parse the response
+    content = response.choices[0].message.content
+    if content is None:
+        raise ValueError("No content received from AI")
+    
+    result = orjson.loads(content)
+    transcript = result.pop('transcript', '')
+    return {
+        'transcript': transcript,
+        'task_info': result,
+        'success': True
+    }
+
+
+def process_voice_command(audio, mime_type=None):
     """
     Process voice command to create a task
     
     Args:
-        audio_base64 (str): Base64 encoded audio data
+        audio (str or bytes): Base64 encoded audio data or data URL, or the raw uploaded bytes
+        mime_type (str, optional): MIME type of raw audio bytes; data URLs carry their own
         
     Returns:
         dict: Processed task details
     """
     try:
-        import base64
-        import tempfile
-        
-        # Decode base64 audio
-        audio_data = base64.b64decode(audio_base64.split(',')[1] if ',' in audio_base64 else audio_base64)
-        
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(suffix='.webm', delete=False) as temp_audio:
-            temp_path = temp_audio.name
-            temp_audio.write(audio_data)
-        
-        # Transcribe audio using OpenAI Whisper
-        with open(temp_path, "rb") as audio_file:
-            transcript = openai_client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
+        if isinstance(audio, str):
+            # Split off any "data:audio/webm;base64," prefix
+            header, _, encoded_audio = audio.rpartition(',')
+            if header.startswith('data:'):
+                mime_type = header[len('data:'):].split(';')[0]
+            audio_data = None
+        else:
+            # Raw multipart upload; only base64 encode it if the single-call path needs it
+            encoded_audio = None
+            audio_data = audio
         
-        # Delete temporary file
-        os.remove(temp_path)
+        # wav/mp3 can be transcribed and parsed in a single round trip
+        audio_format = FUSED_AUDIO_FORMATS.get(mime_type)
+        if audio_format:
+            try:
+                if encoded_audio is None:
+                    encoded_audio = base64.b64encode(audio_data).decode('ascii')
+                return _process_voice_command_fused(encoded_audio, audio_format)
+            except Exception as e:
+                current_app.logger.warning(f"Single-call voice processing failed, using Whisper instead: {str(e)}")
         
-        # Process the transcript to extract task information
-        prompt = (
-            f"Extract task information from this voice command: '{transcript.text}'\n"
-            "Parse it into JSON format with the following fields:\n"
-            "1. title: The task title (create a concise, professional title based on the context)\n"
-            "2. description: Detailed task description (expand on what was mentioned to create a comprehensive task description)\n"
-            "3. service_type: Type of service (e.g., Legal, IT, Consulting, Design, etc.)\n"
-            "4. priority: Task priority (low, medium, high - infer based on urgency words or task importance)\n"
-            "5. client_name: Name of the client (exact name as mentioned)\n"
-            "6. deadline: Suggested deadline in days from now (if mentioned or can be reasonably inferred)\n"
-            "Always extract as much detail as possible from the voice command. If specific information isn't provided, make a reasonable inference based on the context of the task."
+        if audio_data is None:
+            audio_data = base64.b64decode(encoded_audio)
+        
+        # Transcribe audio using OpenAI Whisper, uploading straight from memory; the
+        # filename tells the API which container format the bytes are in
+        openai_rate_limiter.acquire()
+        transcript = openai_client.audio.transcriptions.create(
+            model="whisper-1",
+            file=(f"audio.{audio_format or 'webm'}", audio_data)
         )
         
+        # Process the transcript to extract task information
+        prompt = VOICE_TRANSCRIPT_PROMPT.format(transcript=transcript.text)
+        
         # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
         # do not change this unless explicitly requested by the user
+        openai_rate_limiter.acquire(_estimate_tokens(VOICE_SYSTEM_PROMPT + prompt, 500))
         response = openai_client.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
                     "role": "system", 
-                    "content": "You are an assistant that extracts task information from voice commands."
+                    "content": VOICE_SYSTEM_PROMPT
                 },
                 {"role": "user", "content": prompt}
             ],
-            response_format={"type": "json_object"},
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "voice_task", "schema": VOICE_TASK_SCHEMA, "strict": True}
+            },
             temperature=0.3,
             max_tokens=500
         )
@@ -269,7 +1102,7 @@ def process_voice_command(audio_base64):
         # Parse the response
         content = response.choices[0].message.content
         if content is not None:
-            result = json.loads(content)
+            result = orjson.loads(content)
             return {
                 'transcript': transcript.text,
                 'task_info': result,
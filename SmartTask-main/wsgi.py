@@ -0,0 +1,12 @@
+# Patch the standard library before anything else imports socket, ssl or
+# threading, so blocking database, SMTP and OpenAI calls yield to other
+# requests instead of pinning the worker.
+from gevent import monkey
+monkey.patch_all()
+
+# psycopg2 is a C extension and doesn't go through the patched socket module,
+# so it needs its own wait callback to cooperate with gevent.
+from psycogreen.gevent import patch_psycopg
+patch_psycopg()
+
+from app import app  # noqa: E402, F401